@@ -1,10 +1,31 @@
+import argparse
+import mmap
 import os
+import shutil
 import subprocess
-import textwrap
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from math import ceil
 from math import floor
+from math import sqrt
 
-from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+from PIL import Image, ImageFont
+
+try:
+    import numba
+except ImportError:
+    # Optional - without it, the glyphs are copied with plain NumPy, which is a bit slower
+    numba = None
+
+try:
+    import pygit2
+except ImportError:
+    # Optional - without it, the files are listed with the git command line tool and read from the working tree
+    pygit2 = None
 
 IMAGE_PADDING = 10
 LINE_CHAR_LIMIT = 150
@@ -14,9 +35,49 @@ TARGET_ASPECT_RATIO = 1
 # (~20+ seconds) to run, you probably need to reduce this - the image will be too big to reasonably load anyway.
 FONT_SIZE = 6
 MONOSPACE_FONT_PATH = "/usr/share/fonts/truetype/ubuntu/UbuntuMono[wght].ttf"
+# Save a 1-bit black and white image instead of an anti-aliased grayscale one. The file is much smaller, but small
+# fonts get noticeably harder to read.
+MONOCHROME_OUTPUT = False
+# zlib compression level for normal runs. The images are mostly long runs of white, so even the fastest level gets
+# close to the best possible size.
+PNG_COMPRESS_LEVEL = 1
+# External PNG optimizers to try (in order) when saving in archival mode. They all overwrite {image} in place.
+PNG_OPTIMIZER_COMMANDS = [
+    ["oxipng", "-o", "max", "--strip", "safe", "{image}"],
+    ["zopflipng", "-y", "-m", "{image}", "{image}"],
+    ["pngcrush", "-ow", "-brute", "{image}"],
+]
+# Images bigger than this (in bytes, which is also pixels) are split into several tiles so they don't have to be in
+# memory all at once. Most image viewers struggle well before this anyway.
+MAX_IMAGE_BYTES = 512 * 1024 * 1024
+# The characters that get a pre-rendered glyph - everything else is drawn as a '?'.
+PRINTABLE_CHARS = ''.join(chr(code) for code in range(ord(' '), ord('~') + 1))
+# Maps every byte value to the index of the glyph used to draw it.
+GLYPH_INDICES = np.full(256, PRINTABLE_CHARS.index('?'), dtype=np.uint8)
+GLYPH_INDICES[ord(' '):ord('~') + 1] = np.arange(len(PRINTABLE_CHARS))
+GLYPH_INDICES[[ord(char) for char in '\t\n\v\f\r']] = PRINTABLE_CHARS.index(' ')
+
+# How many files to read at once. Reading is mostly waiting on the disk, so this can be well above the core count.
+READ_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# How far into a file to look for a null byte when deciding if it's binary (the same as git does).
+BINARY_CHECK_LENGTH = 8000
+
+# The contents of a file - mapped or viewed rather than copied where possible.
+FileContents = bytes | memoryview | mmap.mmap
+# A file in the repository, along with a function that reads its contents.
+RepoFile = tuple[str, Callable[[], FileContents]]
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Turn a Git repository into an image.")
+    parser.add_argument(
+        "--archival",
+        action="store_true",
+        help="spend (a lot) more time compressing the image to make the file as small as possible"
+    )
+    args = parser.parse_args()
+
     if LINE_CHAR_LIMIT < 40:
         print("Error: Line character limit must be at least 40.")
         exit(1)
@@ -24,59 +85,189 @@ def main():
     print("Enter a path to the root of a repository to visualize:")
     path = input()
 
-    repo_contents = assemble_repository_into_string(path)
+    repo_files = list_repository_files(path)
+    # There would be nothing to draw (and no way to lay it out)
+    if not repo_files:
+        print("Error: There are no committed files to visualize.")
+        exit(1)
 
     text_to_image(
-        text=repo_contents,
+        # The files are read twice (once to lay out the image, once to draw it) rather than being held in memory
+        lines=lambda: iter_repository_lines(repo_files),
         output_image_path="text_visualization.png",
-        font_path=MONOSPACE_FONT_PATH
+        font_path=MONOSPACE_FONT_PATH,
+        archival=args.archival
     )
 
 
-def assemble_repository_into_string(repo_path: str) -> str:
-    assembled_string = ""
-
+def list_repository_files(repo_path: str) -> list[RepoFile]:
     if not os.path.isdir(repo_path):
         print("Error: Path must be a directory.")
         exit(1)
 
-    branch_name = run_command("git branch --show-current", repo_path)
-    repo_filenames = run_command(f"git ls-tree -r {branch_name} --name-only", repo_path).split("\n")
+    # Reading the objects straight out of the repository saves starting a git process and going through the filesystem
+    if pygit2 is not None:
+        return list_repository_files_with_pygit2(repo_path)
+
+    # -z separates the names with null bytes instead of newlines, so any filename (even one with a newline in it) comes
+    # through intact
+    ls_tree = subprocess.run(
+        ["git", "ls-tree", "-r", "-z", "--name-only", "HEAD"],
+        cwd=repo_path,
+        capture_output=True
+    )
+    if ls_tree.returncode != 0:
+        print(f"Error: Couldn't list the files in the repository: {ls_tree.stderr.decode(errors='replace').strip()}")
+        exit(1)
+
+    # The output ends with a null byte, so skip the empty name after it
+    return [
+        (repo_filename, partial(read_working_tree_file, repo_path, repo_filename))
+        for repo_filename in map(os.fsdecode, ls_tree.stdout.split(b'\0')) if repo_filename
+    ]
+
+
+def list_repository_files_with_pygit2(repo_path: str) -> list[RepoFile]:
+    try:
+        repo = pygit2.Repository(repo_path)
+        tree = repo.revparse_single('HEAD').peel(pygit2.Tree)
+    except KeyError:
+        print("Error: Couldn't list the files in the repository: HEAD doesn't point to a commit yet.")
+        exit(1)
+    except pygit2.GitError as error:
+        print(f"Error: Couldn't list the files in the repository: {error}")
+        exit(1)
+
+    # pygit2 finds the repository even from a subdirectory, so (like `git ls-tree` run from that directory) only list
+    # the files under it, relative to it
+    relative_path = os.path.relpath(os.path.realpath(repo_path), os.path.realpath(repo.workdir or repo.path))
+    if relative_path != '.':
+        try:
+            tree = tree[relative_path.replace(os.sep, '/')]
+        except KeyError:
+            # Nothing under this directory has been committed
+            return []
 
-    for repo_filename in repo_filenames:
-        print(f'Reading {repo_filename}')
+    return list(iter_tree_files(repo, tree))
 
-        if len(repo_filename) > LINE_CHAR_LIMIT:
-            formatted_filename = repo_filename[:22] + '...' + repo_filename[-(LINE_CHAR_LIMIT - 25):]
+
+def iter_tree_files(repo, tree, path_prefix: str = '') -> Iterator[RepoFile]:
+    """
+    Recursively yields every file in a pygit2 tree, in the same order as `git ls-tree -r`.
+    """
+
+    for entry in tree:
+        entry_path = path_prefix + entry.name
+        if entry.type_str == 'tree':
+            yield from iter_tree_files(repo, entry, entry_path + '/')
+        elif entry.type_str == 'commit':
+            # Submodules are stored as a commit in another repository, so there's nothing here to read
+            yield entry_path, read_submodule
         else:
-            empty_space_length = floor((LINE_CHAR_LIMIT - len(repo_filename)) / 2)
-            formatted_filename = '*' * empty_space_length + repo_filename + '*' * empty_space_length
+            # Only keep the blob's ID - holding on to the blob itself would keep every file's contents in memory
+            yield entry_path, partial(read_blob, repo, entry.id)
 
-        assembled_string += f"""
 
-{formatted_filename}
+def read_working_tree_file(repo_path: str, repo_filename: str) -> FileContents:
+    with open(f'{repo_path}/{repo_filename}', 'rb') as repo_file:
+        # Empty files can't be mapped
+        if os.fstat(repo_file.fileno()).st_size == 0:
+            return b''
+        # Map the file instead of reading it, so binary files (which aren't shown) are never copied into memory
+        return mmap.mmap(repo_file.fileno(), 0, access=mmap.ACCESS_READ)
 
-"""
 
-        try:
-            with open(f'{repo_path}/{repo_filename}', 'r', encoding='utf-8') as repo_file:
-                assembled_string += repo_file.read()
-        except UnicodeDecodeError:
-            assembled_string += '(Binary file)'
-        except IsADirectoryError:
-            assembled_string += '(Is a directory - possibly a submodule)'
+def read_blob(repo, blob_id) -> FileContents:
+    # A blob exposes its data through the buffer protocol, so this doesn't copy it
+    return memoryview(repo[blob_id])
+
 
-    print('All files read.')
+def read_submodule() -> FileContents:
+    raise IsADirectoryError
 
-    return assembled_string
 
+def iter_repository_lines(repo_files: list[RepoFile]) -> Iterator[bytes]:
+    """
+    Yields the lines of the image (before wrapping) - a header for each file followed by its contents. Files are read in
+    parallel, but only a few more than READ_WORKERS are held in memory at a time.
+    """
 
-def run_command(command: str, cwd: str = None) -> str:
-    process = subprocess.Popen(command.split(' '), cwd=cwd, stdout=subprocess.PIPE, text=True)
-    return process.stdout.read().strip()
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        for file_lines in bounded_map(executor, read_file_lines, repo_files, READ_WORKERS * 2):
+            yield from file_lines
 
 
-def text_to_image(text: str, output_image_path: str, font_path: str = None):
+def bounded_map(executor: Executor, fn: Callable, items: Iterable, max_pending: int) -> Iterator:
+    """
+    Like executor.map, but only submits up to max_pending items ahead of the results being used, so neither the items
+    nor the results all need to be in memory at once.
+    """
+
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        # Collect the oldest results first so they stay in order
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def read_file_lines(repo_file: RepoFile) -> list[bytes]:
+    """
+    Reads a file as a header followed by its lines. The lines are kept as bytes - they're only drawn one byte per
+    character anyway, so there's no need to decode them.
+    """
+
+    repo_filename, read_contents = repo_file
+    # Expand tabs so lines are measured (and drawn) at their real width. Unlike split(b'\n'), splitlines() also handles
+    # Windows line endings and doesn't add an empty line for a trailing newline.
+    file_lines = read_repository_file(read_contents).expandtabs().splitlines()
+    formatted_filename = format_filename(repo_filename).encode('ascii', errors='replace')
+    return [b"", b"", formatted_filename, b""] + file_lines
+
+
+def count_wrapped_lines(line: bytes) -> int:
+    # Rounded up, and an empty line still takes up a line
+    return max(1, (len(line) + LINE_CHAR_LIMIT - 1) // LINE_CHAR_LIMIT)
+
+
+def wrap_line(line: bytes) -> tuple[bytes, ...]:
+    # Most lines of code fit on one line, so there's nothing to do
+    if len(line) <= LINE_CHAR_LIMIT:
+        return (line,)
+    # This is code, not prose, so there's no point looking for word boundaries - just cut it into equal pieces. That
+    # also keeps the indentation of the wrapped pieces lined up.
+    return tuple(line[start:start + LINE_CHAR_LIMIT] for start in range(0, len(line), LINE_CHAR_LIMIT))
+
+
+def format_filename(repo_filename: str) -> str:
+    if len(repo_filename) > LINE_CHAR_LIMIT:
+        return repo_filename[:22] + '...' + repo_filename[-(LINE_CHAR_LIMIT - 25):]
+
+    empty_space_length = floor((LINE_CHAR_LIMIT - len(repo_filename)) / 2)
+    return '*' * empty_space_length + repo_filename + '*' * empty_space_length
+
+
+def read_repository_file(read_contents: Callable[[], FileContents]) -> bytes:
+    try:
+        contents = read_contents()
+    except IsADirectoryError:
+        return b'(Is a directory - possibly a submodule)'
+
+    # Text files essentially never contain a null byte, so only check the start of the file rather than decoding it all
+    if b'\x00' in bytes(contents[:BINARY_CHECK_LENGTH]):
+        return b'(Binary file)'
+    return bytes(contents)
+
+
+def text_to_image(
+        lines: Callable[[], Iterable[bytes]],
+        output_image_path: str,
+        font_path: str = None,
+        archival: bool = False
+):
     # Load the font
     try:
         font = ImageFont.truetype(font_path or "error", FONT_SIZE)
@@ -85,48 +276,223 @@ def text_to_image(text: str, output_image_path: str, font_path: str = None):
             "Font not found. Using default PIL font, but this is not a monospace font - things will not line up perfectly.")
         font = ImageFont.load_default()
 
-    # Define the starting position and line height
-    x_pos, y_pos = IMAGE_PADDING, IMAGE_PADDING
-    # A reliable way to get line height + a little spacing
-    line_height = font.getbbox("Tg")[3] + 2
-    # Get the max line width - it should be the same regardless of the content if the font is monospaced
-    line_width = font.getbbox("a" * LINE_CHAR_LIMIT)[2]
-
-    original_lines = text.split('\n')
-
-    # Count total lines after wrapping (including paragraph spacing as in drawing)
-    wrapped_lines = []
-    for line in original_lines:
-        wrapped_line = [""] if line == "" else textwrap.wrap(line, width=LINE_CHAR_LIMIT)
-        wrapped_lines += wrapped_line
-    lines_count = len(wrapped_lines)
+    # The font's ascent + descent is the height of a line, then add a little spacing. (The basic bitmap font that PIL
+    # falls back to without FreeType doesn't have metrics, so measure some tall and low characters instead.)
+    if hasattr(font, "getmetrics"):
+        ascent, descent = font.getmetrics()
+        line_height = ascent + descent + 2
+    else:
+        line_height = font.getbbox("Tg")[3] + 2
+    # Every character gets a fixed-size cell - with a monospaced font this is just the advance of a single character
+    char_width = ceil(font.getlength("a")) if hasattr(font, "getlength") else font.getbbox("a")[2]
+    line_width = char_width * LINE_CHAR_LIMIT
+    glyphs = build_glyphs(font, char_width, line_height)
+
+    # Count the lines first so we know how big the image needs to be. There's no need to actually wrap them for this.
+    print("Laying out text...")
+    lines_count = sum(count_wrapped_lines(line) for line in lines())
 
     columns = calculate_optimal_columns(line_width, line_height, lines_count)
     lines_per_column = ceil(lines_count / columns)
 
-    # Create image and draw context now that we know the needed height and columns
-    image_width = int(line_width * columns + IMAGE_PADDING * (columns + 1))
+    # Work out the image size now that we know the needed height and columns
+    image_width = calculate_image_width(line_width, columns)
     image_height = int(lines_per_column * line_height + IMAGE_PADDING * 2)
-    img = Image.new('RGB', (image_width, image_height), color='white')
-    draw = ImageDraw.Draw(img)
-
-    # Draw the text using the same wrapping configuration
-    current_line_num = 1
-    for line in wrapped_lines:
-        draw.text((x_pos, y_pos), line, fill='black', font=font)
-        y_pos += line_height
-
-        current_line_num += 1
-        if current_line_num > lines_per_column:
-            current_line_num = 1
-            x_pos += line_width + IMAGE_PADDING
-            y_pos = IMAGE_PADDING
-
-    # Save the final image
-    img.save(output_image_path)
+
+    # If the image is too big, split it into tiles of whole columns. (Splitting by column rather than by row means each
+    # tile can be finished and saved before moving on to the next.)
+    if image_width * image_height > MAX_IMAGE_BYTES:
+        columns_per_tile = max(1, (MAX_IMAGE_BYTES // image_height - IMAGE_PADDING) // (line_width + IMAGE_PADDING))
+        tiles_count = ceil(columns / columns_per_tile)
+        print(f"The image is too big to draw at once, so it will be split into {tiles_count} tiles.")
+    else:
+        columns_per_tile = columns
+
+    # Columns don't overlap, so they're rendered separately (and in parallel), then copied onto the canvas. With only
+    # one worker, a process pool would just add the cost of sending every column back and forth, so skip it.
+    print("Drawing text...")
+    render_workers = min(columns, os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=render_workers) if render_workers > 1 else nullcontext() as executor:
+        column_glyph_indices = iter_column_glyph_indices(lines(), lines_per_column)
+        if executor is None:
+            column_images = map(partial(render_column, glyphs), column_glyph_indices)
+        else:
+            column_images = bounded_map(
+                executor,
+                partial(render_column, glyphs),
+                column_glyph_indices,
+                render_workers * 2
+            )
+
+        canvas = None
+        tile_num = 0
+        for column_num, column_image in enumerate(column_images):
+            tile_num, tile_column_num = divmod(column_num, columns_per_tile)
+            if tile_column_num == 0:
+                # The previous tile is finished
+                if canvas is not None:
+                    save_tile(canvas, output_image_path, tile_num - 1, columns_per_tile < columns, archival)
+
+                # The text is black on white, so a single grayscale channel is all we need
+                tile_columns = min(columns_per_tile, columns - column_num)
+                canvas = np.full((image_height, calculate_image_width(line_width, tile_columns)), 255, dtype=np.uint8)
+
+            x_pos = IMAGE_PADDING + tile_column_num * (line_width + IMAGE_PADDING)
+            column_height, column_width = column_image.shape
+            canvas[IMAGE_PADDING:IMAGE_PADDING + column_height, x_pos:x_pos + column_width] = column_image
+
+    # Save the final image (or tile)
+    if canvas is not None:
+        save_tile(canvas, output_image_path, tile_num, columns_per_tile < columns, archival)
+
+
+def calculate_image_width(line_width: int, columns: int) -> int:
+    return int(line_width * columns + IMAGE_PADDING * (columns + 1))
+
+
+def save_tile(canvas: np.ndarray, output_image_path: str, tile_num: int, tiled: bool, archival: bool):
+    if tiled:
+        output_image_path_base, output_image_extension = os.path.splitext(output_image_path)
+        output_image_path = f"{output_image_path_base}_{tile_num}{output_image_extension}"
+
+    save_image(canvas, output_image_path, archival)
     print(f"Image saved successfully to {output_image_path}")
 
 
+def save_image(canvas: np.ndarray, output_image_path: str, archival: bool):
+    compress_level = 9 if archival else PNG_COMPRESS_LEVEL
+
+    if MONOCHROME_OUTPUT and shutil.which("pnmtopng"):
+        # A 1-bit image can be written as a PBM with plain NumPy, then converted by netpbm without going through PIL
+        convert_pbm_to_png(encode_pbm(canvas < 128), output_image_path, compress_level)
+    elif MONOCHROME_OUTPUT:
+        # A boolean array becomes a mode '1' image, which PIL saves as a 1-bit PNG
+        Image.fromarray(canvas >= 128).save(
+            output_image_path, format='PNG', compress_level=compress_level, optimize=archival
+        )
+    else:
+        Image.fromarray(canvas).save(output_image_path, format='PNG', compress_level=compress_level, optimize=archival)
+
+    if archival:
+        optimize_png(output_image_path)
+
+
+def encode_pbm(black_pixels: np.ndarray) -> bytes:
+    """
+    Encodes a boolean array (True for black) as a binary PBM image - a short header followed by the rows, packed 8
+    pixels to a byte.
+    """
+
+    height, width = black_pixels.shape
+    return f"P4\n{width} {height}\n".encode('ascii') + np.packbits(black_pixels, axis=1).tobytes()
+
+
+def convert_pbm_to_png(pbm_data: bytes, output_image_path: str, compress_level: int):
+    with open(output_image_path, 'wb') as output_file:
+        subprocess.run(
+            ["pnmtopng", "-compression", str(compress_level)],
+            input=pbm_data,
+            stdout=output_file,
+            check=True
+        )
+
+
+def optimize_png(image_path: str):
+    """
+    Recompresses a PNG in place with the first external optimizer that's installed, if any.
+    """
+
+    for command in PNG_OPTIMIZER_COMMANDS:
+        if shutil.which(command[0]):
+            print(f"Optimizing image with {command[0]}...")
+            subprocess.run([arg.replace("{image}", image_path) for arg in command], check=True)
+            return
+
+    optimizer_names = ', '.join(command[0] for command in PNG_OPTIMIZER_COMMANDS)
+    print(f"No PNG optimizer found (tried {optimizer_names}), so the image wasn't optimized any further.")
+
+
+def build_glyphs(font, char_width: int, line_height: int) -> np.ndarray:
+    """
+    Renders every printable ASCII character once, so the text can be drawn by copying pixels around instead of going
+    through the font rasterizer for every line. Returns an array of shape (character, y, x).
+    """
+
+    glyphs = []
+    for char in PRINTABLE_CHARS:
+        # Each glyph gets an image of its own, so any part of it that sticks out of its cell (like the bottom of a '_'
+        # or the overhang of a 'W') is cut off rather than drawn into the next character's cell
+        glyph = Image.new('L', (char_width, line_height), color=255)
+        # This is what ImageDraw.text does under the hood, without the extra handling for colors, strokes, anchors, etc.
+        if isinstance(font, ImageFont.FreeTypeFont):
+            mask, (x_offset, y_offset) = font.getmask2(char, mode='L')
+        else:
+            mask, (x_offset, y_offset) = font.getmask(char, mode='L'), (0, 0)
+        glyph.im.paste(0, (x_offset, y_offset, x_offset + mask.size[0], y_offset + mask.size[1]), mask)
+        glyphs.append(np.asarray(glyph))
+
+    return np.stack(glyphs)
+
+
+def iter_column_glyph_indices(lines: Iterable[bytes], lines_per_column: int) -> Iterator[np.ndarray]:
+    """
+    Wraps the lines and splits them into columns, yielding the glyph index of every character in each column as an
+    array with shape (line, character). Index 0 is a space, so short lines are padded with blank glyphs.
+    """
+
+    column_glyph_indices = np.zeros((lines_per_column, LINE_CHAR_LIMIT), dtype=np.uint8)
+    current_line_num = 0
+    for line in lines:
+        for wrapped_line in wrap_line(line):
+            line_bytes = np.frombuffer(wrapped_line, dtype=np.uint8)
+            column_glyph_indices[current_line_num, :len(line_bytes)] = GLYPH_INDICES[line_bytes]
+
+            current_line_num += 1
+            if current_line_num == lines_per_column:
+                yield column_glyph_indices
+                column_glyph_indices = np.zeros((lines_per_column, LINE_CHAR_LIMIT), dtype=np.uint8)
+                current_line_num = 0
+
+    # The last column is usually only partly full
+    if current_line_num > 0:
+        yield column_glyph_indices[:current_line_num]
+
+
+def render_column(glyphs: np.ndarray, glyph_indices: np.ndarray) -> np.ndarray:
+    """
+    Draws a column of text (an array of glyph indices with shape (line, character)) by copying the glyph for each
+    character into place.
+    """
+
+    lines, chars = glyph_indices.shape
+    _, char_height, char_width = glyphs.shape
+
+    if numba is not None:
+        column_image = np.full((lines * char_height, chars * char_width), 255, dtype=np.uint8)
+        blit_column_compiled(column_image, glyphs, glyph_indices)
+        return column_image
+
+    # (line, character, y, x) -> (line, y, character, x), which lines the pixels up the same way as the image
+    return glyphs[glyph_indices].transpose(0, 2, 1, 3).reshape(lines * char_height, chars * char_width)
+
+
+if numba is not None:
+    # Not parallel=True - the columns are already rendered in parallel by separate processes
+    @numba.njit(cache=True)
+    def blit_column_compiled(column_image, glyphs, glyph_indices):
+        _, char_height, char_width = glyphs.shape
+        for line_num in range(glyph_indices.shape[0]):
+            glyph_y_pos = line_num * char_height
+            for char_num in range(glyph_indices.shape[1]):
+                glyph_index = glyph_indices[line_num, char_num]
+                # Spaces are blank, and the image starts out blank
+                if glyph_index != 0:
+                    glyph_x_pos = char_num * char_width
+                    column_image[glyph_y_pos:glyph_y_pos + char_height, glyph_x_pos:glyph_x_pos + char_width] = (
+                        glyphs[glyph_index]
+                    )
+
+
 def calculate_optimal_columns(line_width, line_height, lines_count):
     """
     Calculates the optimal number of columns to achieve a target aspect ratio.
@@ -136,14 +502,16 @@ def calculate_optimal_columns(line_width, line_height, lines_count):
         print("Error: Line height and width must be positive values.")
         exit(1)
 
+    # Ignoring the rounding below, the aspect ratio is (columns * line_width) / (lines_count / columns * line_height).
+    # Setting that equal to the target and solving for columns gives the ideal (fractional) number of columns.
+    ideal_columns = sqrt(TARGET_ASPECT_RATIO * lines_count * line_height / line_width)
+
     # Initialize variables to track the best result
     best_columns = 0
     best_difference_from_target = float('inf')
-    current_tested_columns = 0
-
-    while True:
-        current_tested_columns += 1
 
+    # Only the whole numbers on either side of the ideal can be the best result, so just test those two.
+    for current_tested_columns in sorted({max(1, floor(ideal_columns)), max(1, ceil(ideal_columns))}):
         total_width = current_tested_columns * line_width
 
         # The total number of lines must be an integer. Round up because lines use the full height even if they don't
@@ -163,9 +531,8 @@ def calculate_optimal_columns(line_width, line_height, lines_count):
         if difference < best_difference_from_target:
             best_difference_from_target = difference
             best_columns = current_tested_columns
-        else:
-            # We started at the minimum, so once it stops improving, we know we've found the best possible result.
-            return best_columns
+
+    return best_columns
 
 
 if __name__ == "__main__":